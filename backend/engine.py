@@ -0,0 +1,325 @@
+"""CSV parsing and reorder math shared by the API apps (``main.py`` and ``app/main.py``)."""
+from pydantic import BaseModel
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO
+from datetime import timedelta, date
+
+try:
+    import polars as pl
+except ImportError:  # pandas-only fallback
+    pl = None
+
+try:
+    from numba import njit
+except ImportError:  # run the kernels as plain Python
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+REQUIRED_COLS = ["SKU", "Date", "UnitsSold", "OnHand", "LeadTimeDays"]
+
+# Every uvicorn worker owns its own pool, so by default the CPUs are split between
+# them (uvicorn takes its --workers default from WEB_CONCURRENCY)
+PROCESS_POOL_WORKERS = int(
+    os.environ.get("PROCESS_POOL_WORKERS")
+    or max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", 1)))
+)
+
+
+# Built per SKU without validation; RecommendationOut only documents the response schema
+@dataclass(slots=True)
+class Recommendation:
+    sku: str
+    current_stock: float
+    avg_daily_sales: float
+    forecast_30d: float
+    reorder_qty: float
+    reorder_by: str | None
+    lead_time_days: int
+    moq: int | None
+    unit_cost: float | None
+    status: str
+    reason: str
+
+
+class RecommendationOut(BaseModel):
+    sku: str
+    current_stock: float
+    avg_daily_sales: float
+    forecast_30d: float
+    reorder_qty: float
+    reorder_by: str | None
+    lead_time_days: int
+    moq: int | None
+    unit_cost: float | None
+    status: str
+    reason: str
+
+
+STATUS_LABELS = ("RED", "AMBER", "GREEN")
+
+
+@njit(cache=True)
+def _compute_core(on_hand, lead_time, moq, avg_daily, horizon_days):
+    """Per-SKU reorder math; moq <= 0 means no MOQ, days_to_order -1 means never."""
+    n = on_hand.shape[0]
+    forecast = np.empty(n)
+    reorder_qty = np.empty(n)
+    days_to_order = np.empty(n, dtype=np.int64)
+    status_code = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        avg = avg_daily[i]
+        lt = lead_time[i]
+        forecast[i] = avg * horizon_days
+
+        target_stock = avg * (horizon_days + max(lt, 0))
+        qty = max(0.0, target_stock - on_hand[i])
+        m = moq[i]
+        if m > 0:
+            # Round up to a whole multiple of MOQ with one integer divide (0 stays 0)
+            qty = float((math.ceil(qty) + m - 1) // m * m)
+        reorder_qty[i] = qty
+
+        days_until_stockout = on_hand[i] / avg if avg > 0 else math.inf
+        if math.isfinite(days_until_stockout):
+            days_to_order[i] = max(0, math.floor(days_until_stockout - lt))
+        else:
+            days_to_order[i] = -1
+
+        status_code[i] = 0 if days_until_stockout <= lt else (1 if days_until_stockout <= lt + 7 else 2)
+    return forecast, reorder_qty, days_to_order, status_code
+
+
+DATE_FORMATS = ["%d/%m/%Y", "%Y-%m-%d"]
+
+
+def _parse_date_series(s: pd.Series) -> pd.Series:
+    # Supports dd/mm/yyyy like 1/12/2025 (dayfirst), and ISO formats.
+    # Fixed formats go through pandas' C strptime; only values matching neither
+    # fall back to per-element dayfirst inference.
+    parsed = pd.to_datetime(s, format=DATE_FORMATS[0], errors="coerce")
+    for fmt in DATE_FORMATS[1:]:
+        missing = parsed.isna() & s.notna()
+        if not missing.any():
+            return parsed
+        parsed = parsed.fillna(pd.to_datetime(s[missing], format=fmt, errors="coerce"))
+    missing = parsed.isna() & s.notna()
+    if missing.any():
+        parsed = parsed.fillna(pd.to_datetime(s[missing], errors="coerce", dayfirst=True))
+    return parsed
+
+
+NUMERIC_COLS = ["UnitsSold", "OnHand", "LeadTimeDays", "MOQ", "Cost"]
+# Demand windows, in days back from each SKU's latest date
+AVG_WINDOW_DAYS = 28
+TREND_WINDOW_DAYS = 14
+AGG_COLS = ["OnHand", "LeadTimeDays", "MOQ", "Cost", "avg_daily", "recent14", "prev14"]
+
+
+def _aggregate_pandas(df: pd.DataFrame) -> pd.DataFrame:
+    # Work on a new frame of just the columns we use (no full copy of the caller's df);
+    # only columns that still need parsing/coercion are reallocated.
+    cols = {c: df[c] for c in ["SKU", "Date", *NUMERIC_COLS] if c in df.columns}
+    if not pd.api.types.is_datetime64_any_dtype(cols["Date"]):
+        cols["Date"] = _parse_date_series(cols["Date"])
+
+    for col in NUMERIC_COLS:
+        if col in cols and not pd.api.types.is_numeric_dtype(cols[col]):
+            cols[col] = pd.to_numeric(cols[col], errors="coerce")
+
+    # Dictionary-encode SKU: the sort and factorize below then work on integer codes
+    if not isinstance(cols["SKU"].dtype, pd.CategoricalDtype):
+        cols["SKU"] = cols["SKU"].astype("category")
+
+    df = pd.DataFrame(cols, copy=False).dropna(subset=["SKU", "Date"])
+    if df.empty:
+        return pd.DataFrame(columns=["SKU", *AGG_COLS])
+
+    # Sort once: each SKU's 14/28-day windows are then contiguous row ranges,
+    # located with searchsorted and reduced via prefix sums (no boolean masks)
+    df = df.sort_values(["SKU", "Date"], kind="stable")
+    codes, _ = pd.factorize(df["SKU"])
+    days = df["Date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    days -= days.min()
+    key = codes * (days.max() + AVG_WINDOW_DAYS + 1) + days
+
+    ends = np.flatnonzero(np.r_[codes[1:] != codes[:-1], True]) + 1
+    max_key = key[ends - 1]
+    i28 = np.searchsorted(key, max_key - AVG_WINDOW_DAYS)
+    i14 = np.searchsorted(key, max_key - TREND_WINDOW_DAYS)
+
+    units = df["UnitsSold"].to_numpy(dtype=np.float64, na_value=np.nan)
+    sold = np.r_[0.0, np.cumsum(np.nan_to_num(units))]
+    counted = np.r_[0, np.cumsum(~np.isnan(units))]
+    new_day = np.r_[0, np.cumsum(np.r_[True, key[1:] != key[:-1]])]
+
+    per_sku = df.iloc[ends - 1].reset_index(drop=True)
+    for col in ["MOQ", "Cost"]:
+        if col not in per_sku.columns:
+            per_sku[col] = float("nan")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Average daily sales over the last 28 days (multiple rows per day summed first)
+        per_sku["avg_daily"] = (sold[ends] - sold[i28]) / (new_day[ends] - new_day[i28])
+        per_sku["recent14"] = (sold[ends] - sold[i14]) / (counted[ends] - counted[i14])
+        per_sku["prev14"] = (sold[i14] - sold[i28]) / (counted[i14] - counted[i28])
+    return per_sku[["SKU", *AGG_COLS]]
+
+
+def _parse_date_column(s: "pl.Series") -> "pl.Series":
+    # Same order as _parse_date_series: dd/mm/yyyy, then ISO, and only values
+    # matching neither go through pandas' dayfirst inference.
+    if s.dtype.is_temporal():
+        return s.cast(pl.Date)
+    s = s.cast(pl.String)
+    parsed = s.str.strptime(pl.Date, DATE_FORMATS[0], strict=False)
+    for fmt in DATE_FORMATS[1:]:
+        parsed = parsed.fill_null(s.str.strptime(pl.Date, fmt, strict=False))
+    missing = parsed.is_null() & s.is_not_null()
+    if missing.any():
+        fallback = _parse_date_series(pd.Series(s.filter(missing).to_list(), dtype=object))
+        parsed = parsed.scatter(missing.arg_true(), pl.from_pandas(fallback).cast(pl.Date))
+    return parsed
+
+
+def _aggregate_polars(df: "pl.DataFrame") -> "pl.DataFrame":
+    lf = (
+        df.with_columns(_parse_date_column(df["Date"]))
+        .lazy()
+        .with_columns(
+            *[pl.col(c).cast(pl.Float64, strict=False) for c in NUMERIC_COLS if c in df.columns],
+            *[pl.lit(None, dtype=pl.Float64).alias(c) for c in ["MOQ", "Cost"] if c not in df.columns],
+        )
+        .drop_nulls(["SKU", "Date"])
+        .sort(["SKU", "Date"], maintain_order=True)
+        .with_columns(pl.col("Date").max().over("SKU").alias("_max_date"))
+        # Window flags computed once per row and reused by every filter below
+        .with_columns(
+            (pl.col("Date") >= pl.col("_max_date") - pl.duration(days=AVG_WINDOW_DAYS)).alias("_in_28d"),
+            (pl.col("Date") >= pl.col("_max_date") - pl.duration(days=TREND_WINDOW_DAYS)).alias("_in_14d"),
+        )
+    )
+    in_28d = pl.col("_in_28d")
+    in_14d = pl.col("_in_14d")
+
+    # Rows are already sorted by (SKU, Date), so one ordered group_by pass covers
+    # everything. Average daily sales over the last 28 days = window total / distinct
+    # days in the window (the mean of per-day sums, without a second group_by + join).
+    avg_daily = pl.col("UnitsSold").filter(in_28d).sum() / pl.col("Date").filter(in_28d).n_unique()
+
+    return (
+        lf.group_by("SKU", maintain_order=True)
+        .agg(
+            *[pl.col(c).last() for c in ["OnHand", "LeadTimeDays", "MOQ", "Cost"]],
+            avg_daily.alias("avg_daily"),
+            pl.col("UnitsSold").filter(in_14d).mean().alias("recent14"),
+            pl.col("UnitsSold").filter(in_28d & ~in_14d).mean().alias("prev14"),
+        )
+        .select("SKU", *AGG_COLS)
+        .collect()
+    )
+
+
+def read_csv(source: BinaryIO) -> pa.Table:
+    """Parse with Arrow's multithreaded reader; dates are parsed during the read."""
+    try:
+        table = pacsv.read_csv(
+            source,
+            convert_options=pacsv.ConvertOptions(timestamp_parsers=DATE_FORMATS, strings_can_be_null=True),
+        )
+    except pa.ArrowInvalid:
+        # Inferred types did not hold for the whole file (e.g. stray text in a numeric
+        # column); read those columns as strings and let the aggregation coerce them.
+        source.seek(0)
+        table = pacsv.read_csv(
+            source,
+            convert_options=pacsv.ConvertOptions(
+                column_types={c: pa.string() for c in ["Date", *NUMERIC_COLS]}, strings_can_be_null=True
+            ),
+        )
+    return table
+
+
+def compute_recommendations(df, horizon_days: int = 30) -> list[Recommendation]:
+    """Accepts an Arrow table, a pandas DataFrame or (when installed) a polars DataFrame."""
+    if isinstance(df, pa.Table):
+        df = pl.from_arrow(df) if pl is not None else df.to_pandas(split_blocks=True)
+
+    missing = [c for c in REQUIRED_COLS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+
+    if pl is not None and isinstance(df, pl.DataFrame):
+        per_sku = _aggregate_polars(df)
+    else:
+        per_sku = _aggregate_pandas(df)
+
+    today = date.today()
+    recs: list[Recommendation] = []
+
+    skus = per_sku["SKU"].to_list()
+    on_hand, lead_time, moq, unit_cost, avg_daily, recent14, prev14 = (
+        per_sku[c].to_numpy().astype(np.float64) for c in AGG_COLS
+    )
+    lead_time_days = np.nan_to_num(lead_time).astype(np.int64)
+    moq_units = np.nan_to_num(moq).astype(np.int64)
+    forecast, reorder_qty, days_to_order, status_code = _compute_core(
+        on_hand, lead_time_days, moq_units, avg_daily, horizon_days
+    )
+
+    # Sort by risk then reorder_qty desc, as array keys rather than a per-item lambda
+    for i in np.lexsort((-reorder_qty, status_code)):
+        sku = skus[i]
+        avg = float(avg_daily[i])
+        lead_time_i = int(lead_time_days[i])
+        forecast_30d = float(forecast[i])
+        reorder_qty_i = float(reorder_qty[i])
+        reorder_by = (
+            (today + timedelta(days=int(days_to_order[i]))).isoformat() if days_to_order[i] >= 0 else None
+        )
+        status = STATUS_LABELS[status_code[i]]
+
+        if avg == 0:
+            reason = "No recent sales detected; no reorder recommendation."
+        else:
+            trend_note = ""
+            r, p = recent14[i], prev14[i]
+            if p > 0:
+                pct = (r - p) / p * 100
+                if abs(pct) >= 10:
+                    trend_note = f" Demand changed ~{pct:.0f}% vs prior 2 weeks."
+
+            reason = (
+                f"Avg daily sales {avg:.1f}. Lead time {lead_time_i}d. "
+                f"Forecast next {horizon_days}d {forecast_30d:.0f}. "
+                f"Recommend reorder {reorder_qty_i:.0f} to cover horizon + lead time."
+                + trend_note
+            )
+
+        recs.append(
+            Recommendation(
+                sku=str(sku),
+                current_stock=float(on_hand[i]),
+                avg_daily_sales=avg,
+                forecast_30d=forecast_30d,
+                reorder_qty=reorder_qty_i,
+                reorder_by=reorder_by,
+                lead_time_days=lead_time_i,
+                moq=int(moq_units[i]) if not np.isnan(moq[i]) else None,
+                unit_cost=float(unit_cost[i]) if not np.isnan(unit_cost[i]) else None,
+                status=status,
+                reason=reason,
+            )
+        )
+    return recs
+
+
+def create_process_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: polars/arrow thread pools are not fork-safe
+    return ProcessPoolExecutor(max_workers=PROCESS_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
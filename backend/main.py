@@ -1,33 +1,80 @@
-from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import pandas as pd
-import math
-from datetime import timedelta, date
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import VERSION as PYDANTIC_VERSION
+from dataclasses import asdict
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import logging
+import hashlib
+import threading
+import time
 import jwt
 from jwt import PyJWKClient
 from cachetools import TTLCache
 
-REQUIRED_COLS = ["SKU", "Date", "UnitsSold", "OnHand", "LeadTimeDays"]
+from engine import RecommendationOut, compute_recommendations, create_process_pool, read_csv
+
+logger = logging.getLogger(__name__)
 
 # ===== Clerk JWT settings (set these in Render Environment Variables) =====
 CLERK_JWKS_URL = os.environ.get("CLERK_JWKS_URL", "")
 CLERK_ISSUER = os.environ.get("CLERK_ISSUER", "")
-
-# Cache the JWKS client so we don't refetch keys constantly
-_jwks_client_cache = TTLCache(maxsize=2, ttl=3600)
-
-
-def _get_jwks_client() -> PyJWKClient:
-    if "client" not in _jwks_client_cache:
-        if not CLERK_JWKS_URL:
-            raise HTTPException(status_code=500, detail="Server misconfigured: CLERK_JWKS_URL missing")
-        _jwks_client_cache["client"] = PyJWKClient(CLERK_JWKS_URL)
-    return _jwks_client_cache["client"]
+# How long prefetched signing keys are trusted before the JWKS is fetched again
+# (PyJWKClient's own default lifespan for its cached key set)
+JWKS_LIFESPAN_SECONDS = 300
+
+# Comma-separated frontend origins allowed by CORS (e.g. the Vercel URL)
+ALLOWED_ORIGINS = [o.strip() for o in os.environ.get("ALLOWED_ORIGINS", "http://localhost:3000").split(",") if o.strip()]
+
+# Cache verified token claims so repeat requests skip RS256 verification.
+# Keyed by a token hash; entries also expire with the token's own exp.
+# verify_clerk_token runs in the threadpool and TTLCache is not thread-safe.
+_claims_cache = TTLCache(maxsize=10_000, ttl=60)
+_claims_cache_lock = threading.Lock()
+_signing_keys_lock = threading.Lock()
+
+
+def _refresh_signing_keys(state):
+    # Rebuild the kid index from a fresh JWKS fetch so keys Clerk has removed stop
+    # validating; claims cached under a removed key are dropped with it
+    signing_keys = {k.key_id: k.key for k in state.jwks_client.get_signing_keys(refresh=True)}
+    if state.signing_keys.keys() - signing_keys.keys():
+        with _claims_cache_lock:
+            _claims_cache.clear()
+    state.signing_keys = signing_keys
+    state.signing_keys_fetched_at = time.monotonic()
+
+
+def _refresh_stale_signing_keys(state):
+    # Runs before the claims cache lookup, so a refresh that drops a kid also
+    # invalidates tokens that were verified with it
+    if state.jwks_client is None:
+        return
+    with _signing_keys_lock:
+        if time.monotonic() - state.signing_keys_fetched_at >= JWKS_LIFESPAN_SECONDS:
+            _refresh_signing_keys(state)
+
+
+def _get_signing_key(request: Request, token: str):
+    # Signing keys are indexed by kid; an unknown kid (e.g. after Clerk rotates
+    # keys) falls back to the JWKS client, which refetches.
+    jwks_client = request.app.state.jwks_client
+    if jwks_client is None:
+        raise HTTPException(status_code=500, detail="Server misconfigured: CLERK_JWKS_URL missing")
+
+    signing_keys = request.app.state.signing_keys
+    kid = jwt.get_unverified_header(token).get("kid")
+    if kid not in signing_keys:
+        signing_keys[kid] = jwks_client.get_signing_key(kid).key
+    return signing_keys[kid]
 
 
 def verify_clerk_token(
+    request: Request,
     authorization: str = Header(None),
     x_org_id: str = Header(None),
 ):
@@ -50,21 +97,33 @@ def verify_clerk_token(
         raise HTTPException(status_code=400, detail="Missing X-Org-Id header (select a Company/Organization)")
 
     try:
-        jwks_client = _get_jwks_client()
-        signing_key = jwks_client.get_signing_key_from_jwt(token).key
-
-        payload = jwt.decode(
-            token,
-            signing_key,
-            algorithms=["RS256"],
-            issuer=CLERK_ISSUER,
-            options={"require": ["exp", "iat", "iss", "sub"], "verify_aud": False},
-        )
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except Exception:
+        _refresh_stale_signing_keys(request.app.state)
+    except jwt.PyJWKClientError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+    with _claims_cache_lock:
+        payload = _claims_cache.get(cache_key)
+    if payload is None or payload["exp"] <= time.time():
+        try:
+            signing_key = _get_signing_key(request, token)
+
+            payload = jwt.decode(
+                token,
+                signing_key,
+                algorithms=["RS256"],
+                issuer=CLERK_ISSUER,
+                options={"require": ["exp", "iat", "iss", "sub"], "verify_aud": False},
+            )
+        except HTTPException:
+            raise
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        with _claims_cache_lock:
+            _claims_cache[cache_key] = payload
+
     user_id = payload.get("sub")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
@@ -73,145 +132,47 @@ def verify_clerk_token(
 
 
 # ===== FastAPI app =====
-app = FastAPI(title="SMB Supply Chain AI MVP (Secure)", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Validation speed relies on pydantic v2's Rust core
+    if int(PYDANTIC_VERSION.split(".")[0]) < 2:
+        logger.warning("pydantic %s detected; pydantic>=2.6 is required for fast validation", PYDANTIC_VERSION)
+
+    # Fetch the JWKS up front so the first requests don't race on it; a failed
+    # fetch leaves the keys stale, so the first request tries again
+    app.state.jwks_client = PyJWKClient(CLERK_JWKS_URL) if CLERK_JWKS_URL else None
+    app.state.signing_keys = {}
+    app.state.signing_keys_fetched_at = float("-inf")
+    if app.state.jwks_client is not None:
+        try:
+            await run_in_threadpool(_refresh_signing_keys, app.state)
+        except jwt.PyJWKClientError:
+            logger.warning("Could not prefetch Clerk signing keys; will fetch on first request", exc_info=True)
+
+    app.state.process_pool = create_process_pool()
+    try:
+        yield
+    finally:
+        app.state.process_pool.shutdown()
+
+
+app = FastAPI(
+    title="SMB Supply Chain AI MVP (Secure)",
+    version="0.2.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # for MVP; tighten later
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type", "x-org-id"],
 )
 
-
-class Recommendation(BaseModel):
-    sku: str
-    current_stock: float
-    avg_daily_sales: float
-    forecast_30d: float
-    reorder_qty: float
-    reorder_by: str | None
-    lead_time_days: int
-    moq: int | None
-    unit_cost: float | None
-    status: str
-    reason: str
-
-
-def _ceil_to_moq(qty: float, moq: int | None) -> float:
-    if moq is None or moq <= 0:
-        return float(max(0, qty))
-    if qty <= 0:
-        return 0.0
-    return float(int(math.ceil(qty / moq) * moq))
-
-
-def _parse_date_series(s: pd.Series) -> pd.Series:
-    return pd.to_datetime(s, errors="coerce", dayfirst=True)
-
-
-def compute_recommendations(df: pd.DataFrame, horizon_days: int = 30) -> list[Recommendation]:
-    missing = [c for c in REQUIRED_COLS if c not in df.columns]
-    if missing:
-        raise ValueError(f"Missing required columns: {missing}")
-
-    df = df.copy()
-    df["Date"] = _parse_date_series(df["Date"])
-    df = df.dropna(subset=["Date"])
-
-    for col in ["UnitsSold", "OnHand", "LeadTimeDays", "MOQ", "Cost"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    today = date.today()
-    recs: list[Recommendation] = []
-
-    for sku, g in df.groupby("SKU"):
-        g = g.sort_values("Date")
-        last = g.iloc[-1]
-
-        on_hand = float(last.get("OnHand", 0) or 0)
-        lead_time = int(last.get("LeadTimeDays", 0) or 0)
-
-        moq_val = last.get("MOQ", None)
-        moq = int(moq_val) if pd.notna(moq_val) and moq_val is not None else None
-
-        cost_val = last.get("Cost", None)
-        unit_cost = float(cost_val) if pd.notna(cost_val) and cost_val is not None else None
-
-        recent_cutoff = g["Date"].max() - pd.Timedelta(days=28)
-        recent = g[g["Date"] >= recent_cutoff]
-        if recent.empty:
-            recent = g
-
-        daily = recent.groupby(recent["Date"].dt.date)["UnitsSold"].sum().reset_index()
-        avg_daily = float(daily["UnitsSold"].mean()) if not daily.empty else 0.0
-
-        forecast_30d = avg_daily * horizon_days
-        target_stock = avg_daily * (horizon_days + max(lead_time, 0))
-
-        reorder_qty_raw = max(0.0, target_stock - on_hand)
-        reorder_qty = _ceil_to_moq(reorder_qty_raw, moq)
-
-        days_until_stockout = (on_hand / avg_daily) if avg_daily > 0 else float("inf")
-
-        if math.isfinite(days_until_stockout):
-            days_to_order = max(0, int(math.floor(days_until_stockout - lead_time)))
-            reorder_by = (today + timedelta(days=days_to_order)).isoformat()
-        else:
-            reorder_by = None
-
-        if avg_daily == 0:
-            status = "GREEN"
-            reason = "No recent sales detected; no reorder recommendation."
-        else:
-            if days_until_stockout <= lead_time:
-                status = "RED"
-            elif days_until_stockout <= lead_time + 7:
-                status = "AMBER"
-            else:
-                status = "GREEN"
-
-            trend_note = ""
-            recent14 = g[g["Date"] >= (g["Date"].max() - pd.Timedelta(days=14))]
-            prev14 = g[
-                (g["Date"] < (g["Date"].max() - pd.Timedelta(days=14)))
-                & (g["Date"] >= (g["Date"].max() - pd.Timedelta(days=28)))
-            ]
-            if not recent14.empty and not prev14.empty:
-                r = recent14["UnitsSold"].mean()
-                p = prev14["UnitsSold"].mean()
-                if p > 0:
-                    pct = (r - p) / p * 100
-                    if abs(pct) >= 10:
-                        trend_note = f" Demand changed ~{pct:.0f}% vs prior 2 weeks."
-
-            reason = (
-                f"Avg daily sales {avg_daily:.1f}. Lead time {lead_time}d. "
-                f"Forecast next {horizon_days}d {forecast_30d:.0f}. "
-                f"Recommend reorder {reorder_qty:.0f} to cover horizon + lead time."
-                + trend_note
-            )
-
-        recs.append(
-            Recommendation(
-                sku=str(sku),
-                current_stock=on_hand,
-                avg_daily_sales=avg_daily,
-                forecast_30d=forecast_30d,
-                reorder_qty=reorder_qty,
-                reorder_by=reorder_by,
-                lead_time_days=lead_time,
-                moq=moq,
-                unit_cost=unit_cost,
-                status=status,
-                reason=reason,
-            )
-        )
-
-    order = {"RED": 0, "AMBER": 1, "GREEN": 2}
-    recs.sort(key=lambda r: (order.get(r.status, 9), -r.reorder_qty))
-    return recs
+# Recommendation lists are repetitive JSON (long reason strings); compress them
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
 @app.get("/health")
@@ -219,15 +180,24 @@ def health():
     return {"status": "ok"}
 
 
-@app.post("/api/recommendations", response_model=list[Recommendation])
+@app.post(
+    "/api/recommendations",
+    response_model=None,
+    responses={200: {"model": list[RecommendationOut]}},
+)
 async def recommendations(
+    request: Request,
     file: UploadFile = File(...),
     horizon_days: int = 30,
     auth=Depends(verify_clerk_token),  # ✅ SECURED
 ):
     # auth includes: user_id + org_id
     # For next step: store results under auth["org_id"]
-    content = await file.read()
-    df = pd.read_csv(pd.io.common.BytesIO(content))
-    recs = compute_recommendations(df, horizon_days=horizon_days)
-    return recs
+    # Arrow reads the spooled upload directly (no intermediate bytes copy) and releases
+    # the GIL while parsing; the compact columnar table is what goes to the worker.
+    table = await run_in_threadpool(read_csv, file.file)
+    loop = asyncio.get_running_loop()
+    recs = await loop.run_in_executor(
+        request.app.state.process_pool, compute_recommendations, table, horizon_days
+    )
+    return ORJSONResponse([asdict(r) for r in recs])
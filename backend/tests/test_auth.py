@@ -0,0 +1,72 @@
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+import main
+
+ISSUER = "https://clerk.example.com"
+
+
+def _key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private.public_key(), as_dict=True)
+    return private, {**jwk, "kid": kid, "use": "sig"}
+
+
+def _token(private, kid):
+    now = int(time.time())
+    claims = {"sub": "user_1", "iss": ISSUER, "iat": now, "exp": now + 120}
+    return jwt.encode(claims, private, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    monkeypatch.setattr(main, "CLERK_ISSUER", ISSUER)
+    main._claims_cache.clear()
+    published = {"keys": []}
+    client = jwt.PyJWKClient("https://clerk.example.com/.well-known/jwks.json")
+    monkeypatch.setattr(client, "fetch_data", lambda: published)
+    state = SimpleNamespace(jwks_client=client, signing_keys={}, signing_keys_fetched_at=float("-inf"))
+    return published, state
+
+
+def _verify(state, token):
+    request = SimpleNamespace(app=SimpleNamespace(state=state))
+    return main.verify_clerk_token(request, authorization=f"Bearer {token}", x_org_id="org_1")
+
+
+def test_removed_signing_key_is_rejected_after_refresh(jwks):
+    published, state = jwks
+    current, current_jwk = _key("current")
+    revoked, revoked_jwk = _key("revoked")
+    published["keys"] = [current_jwk, revoked_jwk]
+    main._refresh_signing_keys(state)
+
+    token = _token(revoked, "revoked")
+    assert _verify(state, token)["user_id"] == "user_1"
+
+    # Clerk drops the key; within the lifespan the cached key still applies,
+    # after it the keys are refetched and the token (claims cached) is rejected
+    published["keys"] = [current_jwk]
+    assert _verify(state, token)["user_id"] == "user_1"
+    state.signing_keys_fetched_at -= main.JWKS_LIFESPAN_SECONDS
+    with pytest.raises(HTTPException) as exc:
+        _verify(state, token)
+    assert exc.value.status_code == 401
+    assert "revoked" not in state.signing_keys
+    assert _verify(state, _token(current, "current"))["user_id"] == "user_1"
+
+
+def test_signing_keys_are_reused_within_lifespan(jwks):
+    published, state = jwks
+    private, jwk = _key("current")
+    published["keys"] = [jwk]
+    main._refresh_signing_keys(state)
+    fetched_at = state.signing_keys_fetched_at
+
+    _verify(state, _token(private, "current"))
+    assert state.signing_keys_fetched_at == fetched_at
@@ -0,0 +1,170 @@
+import io
+import math
+from dataclasses import asdict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import compute_recommendations, read_csv
+
+
+def _reference_recommendations(df: pd.DataFrame, horizon_days: int = 30) -> list[dict]:
+    # The original per-SKU groupby implementation, kept as the oracle for both engines
+    df = df.copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce", dayfirst=True)
+    df = df.dropna(subset=["Date"])
+    for col in ["UnitsSold", "OnHand", "LeadTimeDays", "MOQ", "Cost"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    today = date.today()
+    recs = []
+    for sku, g in df.groupby("SKU"):
+        g = g.sort_values("Date")
+        last = g.iloc[-1]
+        on_hand = float(last.get("OnHand", 0) or 0)
+        lead_time = int(last.get("LeadTimeDays", 0) or 0)
+        moq_val = last.get("MOQ", None)
+        moq = int(moq_val) if pd.notna(moq_val) and moq_val is not None else None
+        cost_val = last.get("Cost", None)
+        unit_cost = float(cost_val) if pd.notna(cost_val) and cost_val is not None else None
+
+        max_date = g["Date"].max()
+        recent = g[g["Date"] >= max_date - pd.Timedelta(days=28)]
+        daily = recent.groupby(recent["Date"].dt.date)["UnitsSold"].sum()
+        avg_daily = float(daily.mean()) if not daily.empty else 0.0
+
+        forecast_30d = avg_daily * horizon_days
+        reorder_qty = max(0.0, avg_daily * (horizon_days + max(lead_time, 0)) - on_hand)
+        if moq is not None and moq > 0 and reorder_qty > 0:
+            reorder_qty = float(int(math.ceil(reorder_qty / moq) * moq))
+
+        days_until_stockout = on_hand / avg_daily if avg_daily > 0 else float("inf")
+        reorder_by = None
+        if math.isfinite(days_until_stockout):
+            days_to_order = max(0, int(math.floor(days_until_stockout - lead_time)))
+            reorder_by = (today + timedelta(days=days_to_order)).isoformat()
+
+        if avg_daily == 0:
+            status = "GREEN"
+            reason = "No recent sales detected; no reorder recommendation."
+        else:
+            if days_until_stockout <= lead_time:
+                status = "RED"
+            elif days_until_stockout <= lead_time + 7:
+                status = "AMBER"
+            else:
+                status = "GREEN"
+            trend_note = ""
+            recent14 = g[g["Date"] >= max_date - pd.Timedelta(days=14)]
+            prev14 = g[(g["Date"] < max_date - pd.Timedelta(days=14)) & (g["Date"] >= max_date - pd.Timedelta(days=28))]
+            if not recent14.empty and not prev14.empty:
+                r = recent14["UnitsSold"].mean()
+                p = prev14["UnitsSold"].mean()
+                if p > 0:
+                    pct = (r - p) / p * 100
+                    if abs(pct) >= 10:
+                        trend_note = f" Demand changed ~{pct:.0f}% vs prior 2 weeks."
+            reason = (
+                f"Avg daily sales {avg_daily:.1f}. Lead time {lead_time}d. "
+                f"Forecast next {horizon_days}d {forecast_30d:.0f}. "
+                f"Recommend reorder {reorder_qty:.0f} to cover horizon + lead time."
+                + trend_note
+            )
+
+        recs.append(
+            dict(
+                sku=str(sku),
+                current_stock=on_hand,
+                avg_daily_sales=avg_daily,
+                forecast_30d=forecast_30d,
+                reorder_qty=reorder_qty,
+                reorder_by=reorder_by,
+                lead_time_days=lead_time,
+                moq=moq,
+                unit_cost=unit_cost,
+                status=status,
+                reason=reason,
+            )
+        )
+
+    order = {"RED": 0, "AMBER": 1, "GREEN": 2}
+    recs.sort(key=lambda r: (order[r["status"]], -r["reorder_qty"]))
+    return recs
+
+
+def _sample_csv() -> bytes:
+    # dd/mm/yyyy dates (no zero padding), several rows on some days, gaps between
+    # days, SKUs with no sales and a few unparseable values
+    rng = np.random.default_rng(7)
+    start = date(2025, 1, 1)
+    lines = ["SKU,Date,UnitsSold,OnHand,LeadTimeDays,MOQ,Cost"]
+    for n in range(40):
+        sku = f"S-{n:03d}"
+        moq = "" if n % 5 == 0 else str(int(rng.integers(1, 50)))
+        cost = "" if n % 7 == 0 else f"{rng.uniform(1, 100):.2f}"
+        days = np.sort(rng.choice(90, size=int(rng.integers(5, 60)), replace=True))
+        sold = 0 if n % 11 == 0 else rng.integers(0, 30, size=days.size)
+        for i, d in enumerate(days):
+            day = start + timedelta(days=int(d))
+            units = sold if np.isscalar(sold) else int(sold[i])
+            lines.append(
+                f"{sku},{day.day}/{day.month}/{day.year},{units},"
+                f"{int(rng.integers(0, 500))},{int(rng.integers(1, 30))},{moq},{cost}"
+            )
+    lines.append("S-000,not a date,5,10,3,,")
+    lines.append("S-001,15/4/2025,n/a,10,3,,")
+    return "\n".join(lines).encode()
+
+
+def _assert_same(got, want):
+    assert [r.sku for r in got] == [r["sku"] for r in want]
+    for rec, expected in zip(got, want):
+        assert asdict(rec) == pytest.approx(expected)
+
+
+@pytest.fixture(scope="module")
+def sample():
+    data = _sample_csv()
+    return data, _reference_recommendations(pd.read_csv(io.BytesIO(data)))
+
+
+def test_pandas_engine_matches_reference(sample):
+    data, want = sample
+    _assert_same(compute_recommendations(pd.read_csv(io.BytesIO(data))), want)
+    _assert_same(compute_recommendations(read_csv(io.BytesIO(data)).to_pandas()), want)
+
+
+def test_polars_engine_matches_reference(sample):
+    pl = pytest.importorskip("polars")
+    data, want = sample
+    _assert_same(compute_recommendations(pl.from_arrow(read_csv(io.BytesIO(data)))), want)
+
+
+def test_arrow_table_matches_reference(sample):
+    data, want = sample
+    _assert_same(compute_recommendations(read_csv(io.BytesIO(data))), want)
+
+
+def test_arrow_table_is_left_intact(sample):
+    data, _ = sample
+    table = read_csv(io.BytesIO(data))
+    expected = table.to_pydict()
+    compute_recommendations(table)
+    assert table.to_pydict() == expected
+
+
+@pytest.mark.parametrize("day", ["01-12-2025", "01.12.2025", "01/12/2025 10:00"])
+def test_other_date_formats_fall_back_to_dayfirst(day):
+    data = f"SKU,Date,UnitsSold,OnHand,LeadTimeDays,MOQ,Cost\nA,{day},5,10,3,,\n".encode()
+    want = _reference_recommendations(pd.read_csv(io.BytesIO(data)))
+    assert len(want) == 1
+    _assert_same(compute_recommendations(pd.read_csv(io.BytesIO(data))), want)
+    _assert_same(compute_recommendations(read_csv(io.BytesIO(data))), want)
+
+
+def test_missing_columns():
+    with pytest.raises(ValueError, match="Missing required columns"):
+        compute_recommendations(pd.DataFrame({"SKU": ["A"], "Date": ["1/1/2025"]}))